@@ -0,0 +1,41 @@
+# cython: boundscheck=False, wraparound=False, cdivision=True
+"""Compiled kernels for finding the unique LAEs in
+:meth:`gblearn.gb.GrainBoundaryCollection.uniquify`. This extension is optional;
+if it isn't built, :mod:`gblearn.gb` falls back to numba or NumPy.
+"""
+import numpy as np
+
+def scan_unique(double[:, ::1] NP, double[::1] Psq, double[::1] Pn,
+                Py_ssize_t[::1] cand, double eps):
+    """Sequentially filters the candidate rows of `NP` so that only those that
+    are not similar to an earlier *kept* candidate remain. See
+    :func:`gblearn.gb._scan_unique` for the arguments.
+
+    Returns:
+        numpy.ndarray: of the row indices in `cand` that were kept.
+    """
+    cdef Py_ssize_t c, i, j, m, s, k = 0
+    cdef Py_ssize_t nS = NP.shape[1]
+    cdef double dot, eps2 = eps*eps
+    cdef bint unique
+    keep = np.empty(len(cand), dtype=np.intp)
+    cdef Py_ssize_t[::1] kept = keep
+
+    for c in range(cand.shape[0]):
+        i = cand[c]
+        unique = True
+        for j in range(k):
+            m = kept[j]
+            if abs(Pn[i] - Pn[m]) > eps:
+                continue
+            dot = 0.
+            for s in range(nS):
+                dot += NP[i,s]*NP[m,s]
+            if Psq[i] + Psq[m] - 2*dot < eps2:
+                unique = False
+                break
+        if unique:
+            kept[k] = i
+            k += 1
+
+    return keep[:k]
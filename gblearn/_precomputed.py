@@ -0,0 +1,25 @@
+"""Tabulated neighbor shells and SOAP vectors for the elements in
+:data:`gblearn.elements.elements` at the default parameters.
+
+.. warning:: This file is generated by :mod:`gblearn.build_tables`; don't edit
+  it by hand.
+"""
+PRECOMPUTED_RCUT = 6.0
+"""float: cutoff that :data:`PRECOMPUTED_SHELLS` are valid for.
+"""
+PRECOMPUTED_SHELLS = {
+    'Cr': [2.52013, 2.91, 4.11536, 4.82569, 5.04027, 5.82],
+    'Mg': [3.21, 4.53963, 5.24191, 5.55988],
+    'Ni': [2.48902, 3.52, 4.3111, 4.97803, 5.56561],
+}
+"""dict: keys are element names; values are lists of *all* the neighbor
+shells (in Ang.) within :data:`PRECOMPUTED_RCUT`.
+"""
+PRECOMPUTED_P = {
+    ('Cr', 12, 12, 6.0, 0.5, 0.5): ['Cr_0', 'Cr_1'],
+    ('Mg', 12, 12, 6.0, 0.5, 0.5): ['Mg_0', 'Mg_1'],
+    ('Ni', 12, 12, 6.0, 0.5, 0.5): ['Ni_0'],
+}
+"""dict: keys are `tuple` of the arguments to :func:`gblearn.elements.pissnnl`;
+values are lists of array names in `data/pissnnl.npz`.
+"""
@@ -0,0 +1,93 @@
+"""Generates the tabulated neighbor shells and SOAP vectors for the simple
+elements in :data:`gblearn.elements.elements` so that the common cases don't
+need quippy at runtime. Run it with::
+
+    python -m gblearn.build_tables
+
+It overwrites `gblearn/_precomputed.py` and `gblearn/data/pissnnl.npz`. Pass
+`--shells-only` to re-tabulate just the shells (which also works with the ASE
+fallback) and keep the existing SOAP vectors.
+"""
+from os import path, mkdir
+import numpy as np
+from gblearn import msg
+
+rcut = 6.0
+"""float: cutoff that the neighbor shells are tabulated for.
+"""
+soapargs = (12, 12, 6.0, 0.5, 0.5)
+"""tuple: of (lmax, nmax, rcut, sigma, trans_width) default SOAP parameters
+that the SOAP vectors are tabulated for.
+"""
+header = '''"""Tabulated neighbor shells and SOAP vectors for the elements in
+:data:`gblearn.elements.elements` at the default parameters.
+
+.. warning:: This file is generated by :mod:`gblearn.build_tables`; don't edit
+  it by hand.
+"""
+'''
+
+def build(root=None, soap=True):
+    """Computes the shells and SOAP vectors for every tabulated element and
+    writes them to the package.
+
+    Args:
+        root (str): path to the `gblearn` package directory; defaults to the
+          directory of this module.
+        soap (bool): when False, only the shells are recomputed; the SOAP
+          vectors in `data/pissnnl.npz` (which need quippy) are kept as they
+          are.
+    """
+    from gblearn.elements import elements, _calc_shells, _calc_pissnnl
+    if root is None:
+        root = path.dirname(path.abspath(__file__))
+
+    shells = {}
+    arrays = {}
+    names = {}
+    for e in sorted(elements):
+        shells[e] = _calc_shells(e, rcut)
+        if not soap:
+            continue
+        key = (e,) + soapargs
+        names[key] = []
+        for i, P in enumerate(_calc_pissnnl(*key)):
+            name = "{}_{}".format(e, i)
+            arrays[name] = np.array(P, dtype=np.float64)
+            names[key].append(name)
+
+    if soap:
+        datadir = path.join(root, "data")
+        if not path.isdir(datadir):
+            mkdir(datadir)
+        np.savez(path.join(datadir, "pissnnl.npz"), **arrays)
+    else:
+        from gblearn._precomputed import PRECOMPUTED_P
+        names = PRECOMPUTED_P
+
+    with open(path.join(root, "_precomputed.py"), 'w') as f:
+        f.write(header)
+        f.write("PRECOMPUTED_RCUT = {!r}\n".format(rcut))
+        f.write('"""float: cutoff that :data:`PRECOMPUTED_SHELLS` are valid '
+                'for.\n"""\n')
+        f.write("PRECOMPUTED_SHELLS = {\n")
+        for e in sorted(shells):
+            f.write("    {!r}: {!r},\n".format(e, shells[e]))
+        f.write("}\n")
+        f.write('"""dict: keys are element names; values are lists of *all* '
+                'the neighbor\nshells (in Ang.) within '
+                ':data:`PRECOMPUTED_RCUT`.\n"""\n')
+        f.write("PRECOMPUTED_P = {\n")
+        for key in sorted(names):
+            f.write("    {!r}: {!r},\n".format(key, names[key]))
+        f.write("}\n")
+        f.write('"""dict: keys are `tuple` of the arguments to '
+                ':func:`gblearn.elements.pissnnl`;\nvalues are lists of '
+                'array names in `data/pissnnl.npz`.\n"""\n')
+
+    tabled = "shells and SOAP vectors" if soap else "shells"
+    msg.okay("Tabulated {} for {}.".format(tabled, ", ".join(sorted(elements))))
+
+if __name__ == '__main__':# pragma: no cover
+    import sys
+    build(soap=("--shells-only" not in sys.argv))
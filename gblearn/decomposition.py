@@ -1331,7 +1331,7 @@ class SOAPVector(object):
                 radial functions are smoothly transitioned to zero.    
         """
         from gblearn.elements import pissnnl
-        P = pissnnl(element, **kwargs)[index]
+        P = pissnnl(element, dtype=np.float64, **kwargs)[index]
         decomposer = SOAPDecomposer(1, **kwargs)
         return SOAPVector(P, decomposer)
         
@@ -3,36 +3,210 @@ elements.
 """
 from gblearn import msg
 import numpy as np
-_shells = {}
-"""dict: keys are element names, values are lists of shells (in Ang.).
+from os import path
+from collections import namedtuple
+from gblearn._precomputed import (PRECOMPUTED_RCUT, PRECOMPUTED_SHELLS,
+                                  PRECOMPUTED_P)
+try:
+    from numba import njit
+except ImportError:# pragma: no cover
+    njit = None
+try:
+    import quippy.structures as _qstruct
+except ImportError:# pragma: no cover
+    _qstruct = None
+_lattice_ctors = {}
+"""dict: keys are lattice names; values are the :mod:`quippy.structures`
+constructors for that lattice (or `None` if it isn't available).
 """
+PRECOMPUTED_FILE = path.join(path.dirname(path.abspath(__file__)), "data",
+                             "pissnnl.npz")
+"""str: path to the archive of tabulated SOAP vectors that are listed in
+:data:`gblearn._precomputed.PRECOMPUTED_P`.
+"""
+_shells = None
+"""dict: keys are the strings built by :func:`_shells_key`, values are lists
+of shells (in Ang.). Lazily restored from :data:`_shells_file` on first use.
+"""
+_shells_file = path.join(path.expanduser("~/.cache/gblearn"), "shells.json")
+"""str: path to the on-disk copy of :data:`_shells` so that the tabulated
+shells persist across interpreter sessions.
+"""
+_atoms = {}
+"""dict: keys are element names, values are the :class:`quippy.Atoms`
+structures constructed by :func:`atoms`.
+"""
+_calculators = {}
+"""dict: keys are `tuple` of (rcut, nmax, lmax, sigma, trans_width); values
+are the shared :class:`~gblearn.soap.SOAPCalculator` for those parameters.
+"""
+_pissnnl = {}
+"""dict: keys are `tuple` of the arguments to :func:`pissnnl`; values are the
+list of (read-only, contiguous) SOAP vectors for the basis atoms.
+"""
+
+ElementSpec = namedtuple("ElementSpec", ["lattice", "latpar", "Z", "basis"])
+"""Tabulated crystal definition for a simple element with fields `lattice`
+(`str`), `latpar` (`float` lattice parameter), `Z` (`int` element number) and
+`basis` (read-only :class:`numpy.ndarray` of basis indices).
+"""
+
+def _spec(lattice, latpar, Z, basis):
+    """Returns an :class:`ElementSpec` whose `basis` array is read-only.
+    """
+    basis = np.array(basis, dtype=np.int32)
+    basis.setflags(write=False)
+    return ElementSpec(lattice, latpar, Z, basis)
 
 elements = {
-    "Ni": ("fcc", 3.52, 28, [0]),
-    "Cr": ("bcc", 2.91, 24, [0, 1]),
-    "Mg": ("hcp", 3.21, 12, [0, 1])
+    "Ni": _spec("fcc", 3.52, 28, [0]),
+    "Cr": _spec("bcc", 2.91, 24, [0, 1]),
+    "Mg": _spec("hcp", 3.21, 12, [0, 1])
 }
-"""dict: keys are element names, values are a tuple of (`str` lattice,
-`float` lattice parameter, `int` element number, `list` basis indices).
+"""dict: keys are element names, values are :class:`ElementSpec` tuples of
+(`str` lattice, `float` lattice parameter, `int` element number,
+`numpy.ndarray` basis indices).
 """
 
+def _dedup_sorted(arr, tol):
+    """Returns the values in the *sorted* array `arr` that differ from the
+    previously kept value by more than `tol`.
+
+    Args:
+        arr (numpy.ndarray): sorted, non-empty array of `int` or `float`
+          values.
+        tol (int or float): values closer than this to the last kept value are
+          considered duplicates.
+    """
+    out = np.empty_like(arr)
+    out[0] = arr[0]
+    k = 1
+    for i in range(1, arr.size):
+        if arr[i] - out[k-1] > tol:
+            out[k] = arr[i]
+            k += 1
+    return out[:k]
+
+if njit is not None:
+    _dedup_sorted = njit(cache=True)(_dedup_sorted)
+
+def _ase_ctor(lattice):
+    """Returns a constructor with the same signature as those in
+    :mod:`quippy.structures` that builds the conventional cell for `lattice`
+    using ASE. This is used when quippy isn't available.
+
+    .. note:: The cells, atom order and orientation (and the ideal
+      :math:`c/a=\\sqrt{8/3}` for hcp) are the same as quippy's so that both
+      backends yield identical positions and shells.
+
+    Args:
+        lattice (str): one of ['fcc', 'bcc', 'hcp'].
+    """
+    if lattice not in ("fcc", "bcc", "hcp"):
+        return None
+
+    from ase import Atoms
+    def ctor(latpar, Z):
+        a = latpar
+        if lattice == "fcc":
+            cell = np.eye(3)*a
+            pos = np.array([[0., 0., 0.], [.5, .5, 0.], [.5, 0., .5],
+                            [0., .5, .5]])*a
+        elif lattice == "bcc":
+            cell = np.eye(3)*a
+            pos = np.array([[0., 0., 0.], [.5, .5, .5]])*a
+        else:
+            c = a*np.sqrt(8./3)
+            cell = np.array([[a/2., -a*np.sqrt(3)/2., 0.],
+                             [a/2., a*np.sqrt(3)/2., 0.],
+                             [0., 0., c]])
+            pos = np.array([[0., 0., 0.], [a/2., a/(2*np.sqrt(3)), c/2.]])
+        return Atoms(numbers=[Z]*len(pos), positions=pos, cell=cell, pbc=True)
+    return ctor
+
 def atoms(element):
     """Returns a :class:`quippy.Atoms` structure for the given
     element, using the tabulated lattice parameters.
 
+    .. note:: The structure is constructed once per element and then cached;
+      repeated calls return the *same* object.
+
+    .. note:: If quippy isn't installed, an equivalent :class:`ase.Atoms`
+      structure is returned instead.
+
     Args:
         element (str): name of the element.
     """
+    if element in _atoms:
+        return _atoms[element]
+
     lattice = "unknown"
     if element in elements:
-        import quippy.structures as structures
-        lattice, latpar, Z, basis = elements[element]
-        if hasattr(structures, lattice):
-            return getattr(structures, lattice)(latpar, Z)
+        spec = elements[element]
+        lattice = spec.lattice
+        if lattice not in _lattice_ctors:
+            if _qstruct is not None:
+                _lattice_ctors[lattice] = getattr(_qstruct, lattice, None)
+            else:
+                _lattice_ctors[lattice] = _ase_ctor(lattice)
+        ctor = _lattice_ctors[lattice]
+        if ctor is not None:
+            _atoms[element] = ctor(spec.latpar, spec.Z)
+            return _atoms[element]
 
     emsg = "Element {} with structure {} is not auto-configurable."
     msg.err(emsg.format(element, lattice))
     
+def _load_shells():
+    """Restores the neighbor shells cache from :data:`_shells_file`. A missing
+    or unreadable cache file just yields an empty cache.
+    """
+    global _shells
+    import json
+    try:
+        with open(_shells_file) as f:
+            _shells = json.load(f)
+    except (IOError, OSError, ValueError):
+        _shells = {}
+
+def _save_shells():
+    """Atomically writes the neighbor shells cache to :data:`_shells_file`.
+    """
+    import json
+    import os
+    from tempfile import mkstemp
+    cachedir = path.dirname(_shells_file)
+    try:
+        if not path.isdir(cachedir):
+            os.makedirs(cachedir)
+        fd, tmpfile = mkstemp(dir=cachedir, suffix=".json")
+        with os.fdopen(fd, 'w') as f:
+            json.dump(_shells, f)
+        #`os.replace` is only available for python 3; `rename` is still
+        #atomic on POSIX systems.
+        getattr(os, "replace", os.rename)(tmpfile, _shells_file)
+    except (IOError, OSError):# pragma: no cover
+        msg.warn("Could not save the neighbor shells cache to {}.".format(
+            _shells_file))
+
+def _shells_key(element, rcut):
+    """Returns the key of the shells for `element` in :data:`_shells`. Since
+    the cache persists on disk, the key includes the crystal definition and
+    the structure backend (quippy or ASE), so that changing either doesn't
+    return stale shells.
+
+    Args:
+        element (str): name of the element.
+        rcut (float): maximum cutoff to consider in looking for unique shells.
+    """
+    backend = "ase" if _qstruct is None else "quippy"
+    spec = elements.get(element)
+    if spec is None:
+        crystal = ""
+    else:
+        crystal = "{}:{!r}:{}".format(spec.lattice, float(spec.latpar), spec.Z)
+    return "{}:{}:{}:{!r}".format(element, crystal, backend, float(rcut))
+
 def shells(element, n=6, rcut=6.):
     """Returns the neighbor shells for the specified element.
 
@@ -41,26 +215,75 @@ def shells(element, n=6, rcut=6.):
         n (int): maximum number of shells to return.
         rcut (float): maximum cutoff to consider in looking for unique shells.
     """
-    global _shells
-    if element not in _shells:
+    if element in PRECOMPUTED_SHELLS and rcut == PRECOMPUTED_RCUT:
+        result = PRECOMPUTED_SHELLS[element]
+        return result[0:min((n, len(result)))]
+
+    if _shells is None:
+        _load_shells()
+
+    key = _shells_key(element, rcut)
+    if key not in _shells:
+        _shells[key] = _calc_shells(element, rcut)
+        _save_shells()
+
+    return _shells[key][0:min((n, len(_shells[key])))]
+
+def _calc_shells(element, rcut):
+    """Tabulates *all* the unique neighbor shells for the specified element
+    within `rcut`.
+
+    Args:
+        element (str): name of the element.
+        rcut (float): maximum cutoff to consider in looking for unique shells.
+
+    Returns:
+        list: of sorted `float` shell distances.
+    """
+    #Distances are converted to fixed-point integer keys on a 1e-5 grid so
+    #that the (many) duplicate neighbor distances collapse in a hash set.
+    if _qstruct is not None:
+        #The structure is shared with callers of atoms(), which may have
+        #changed its connectivity, so it is always recalculated here. This
+        #only runs when the shells cache misses anyway.
         a = atoms(element)
         a.set_cutoff(rcut)
         a.calc_connect()
-        result = []
-        for i in a.indices:
-            for neighb in a.connect[i]:
-                dist = neighb.distance
-                deltain = [abs(dist-s) < 1e-5 for s in result]
-                if not any(deltain):
-                    result.append(dist)
+        seen = set(int(round(neighb.distance*1e5)) for i in a.indices
+                   for neighb in a.connect[i])
+        keys = np.array(sorted(seen), dtype=np.int64)
+    else:
+        from ase.neighborlist import neighbor_list
+        dists = neighbor_list('d', atoms(element), rcut)
+        keys = np.unique(np.round(dists*1e5).astype(np.int64))
 
-        _shells[element] = sorted(result)
+    if keys.size == 0:
+        return []
 
-    return _shells[element][0:min((n, len(_shells[element])))]
+    #Keys within a single grid step of the last kept shell belong to that
+    #shell; comparing integers avoids any ambiguity in the tolerance compare.
+    #Without numba the same function just runs interpreted, so that both give
+    #the same shells.
+    keys = _dedup_sorted(keys, 1)
+    return (keys/1e5).tolist()
+
+def _calculator(rcut, nmax, lmax, sigma, trans_width):
+    """Returns the shared :class:`~gblearn.soap.SOAPCalculator` for the given
+    SOAP parameters, creating it if necessary.
+    """
+    key = (rcut, nmax, lmax, sigma, trans_width)
+    if key not in _calculators:
+        from gblearn.soap import SOAPCalculator
+        _calculators[key] = SOAPCalculator(*key)
+    return _calculators[key]
 
-def pissnnl(element, lmax=12, nmax=12, rcut=6.0, sigma=0.5, trans_width=0.5):
+def pissnnl(element, lmax=12, nmax=12, rcut=6.0, sigma=0.5, trans_width=0.5,
+            dtype=np.float32):
     """Computes the :math:`P` matrix for the given element.
 
+    .. note:: Results are cached by argument tuple; the returned vectors are
+      read-only since they are shared between calls.
+
     Args:
         element (str): name of the element.
         nmax (int): bandwidth limits for the SOAP descriptor radial basis
@@ -71,9 +294,68 @@ def pissnnl(element, lmax=12, nmax=12, rcut=6.0, sigma=0.5, trans_width=0.5):
         sigma (float): width parameter for the Gaussians on each atom.
         trans_width (float): distance over which the coefficients in the
             radial functions are smoothly transitioned to zero.    
+        dtype: data type of the returned vectors. Single precision is plenty
+          for the kernel comparisons; use `numpy.float64` for regression
+          testing against double precision results.
+    """
+    dtype = np.dtype(dtype)
+    args = (element, lmax, nmax, rcut, sigma, trans_width)
+    key = args + (dtype,)
+    if key not in _pissnnl:
+        if args in PRECOMPUTED_P:
+            dZ = _load_precomputed(PRECOMPUTED_P[args])
+        else:
+            dZ = _calc_pissnnl(*args)
+        dZ = [np.ascontiguousarray(P, dtype=dtype) for P in dZ]
+        for P in dZ:
+            P.flags.writeable = False
+        _pissnnl[key] = dZ
+
+    return list(_pissnnl[key])
+
+def _calc_pissnnl(element, lmax, nmax, rcut, sigma, trans_width):
+    """Computes the :math:`P` matrix for the given element using the SOAP
+    calculator. See :func:`pissnnl` for the arguments.
+
+    Returns:
+        list: of double precision SOAP vectors, one for each basis atom.
     """
-    lattice, latpar, Z, basis = elements[element]
-    from gblearn.soap import SOAPCalculator
-    SC = SOAPCalculator(rcut, nmax, lmax, sigma, trans_width)
+    spec = elements[element]
+    SC = _calculator(rcut, nmax, lmax, sigma, trans_width)
     a = atoms(element)
-    return SC.calc(a, Z, basis)
+    return SC.calc(a, spec.Z, spec.basis)
+
+def _load_precomputed(names):
+    """Returns the tabulated SOAP vectors with the given names from
+    :data:`PRECOMPUTED_FILE`.
+
+    Args:
+        names (list): of `str` array names in the archive.
+    """
+    with np.load(PRECOMPUTED_FILE) as data:
+        return [data[name] for name in names]
+
+def pissnnl_batch(elems, lmax=12, nmax=12, rcut=6.0, sigma=0.5,
+                  trans_width=0.5, dtype=np.float32):
+    """Computes the :math:`P` matrices for several elements that share the same
+    SOAP parameters. A single :class:`~gblearn.soap.SOAPCalculator` is used for
+    all of them.
+
+    Args:
+        elems (list): of `str` element names.
+        nmax (int): bandwidth limits for the SOAP descriptor radial basis
+          functions.
+        lmax (int): bandwidth limits for the SOAP descriptor spherical
+          harmonics.
+        rcut (float): local environment finite cutoff parameter.
+        sigma (float): width parameter for the Gaussians on each atom.
+        trans_width (float): distance over which the coefficients in the
+            radial functions are smoothly transitioned to zero.
+        dtype: data type of the returned vectors; see :func:`pissnnl`.
+
+    Returns:
+        dict: keys are element names; values are the same as returned by
+        :func:`pissnnl`.
+    """
+    return {e: pissnnl(e, lmax, nmax, rcut, sigma, trans_width, dtype)
+            for e in elems}
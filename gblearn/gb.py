@@ -6,6 +6,175 @@ from gblearn import msg
 from os import path
 from tqdm import tqdm
 from quippy.farray import FortranArray
+try:
+    from numba import njit
+except ImportError:# pragma: no cover
+    njit = None
+try:
+    from gblearn._classify import scan_unique as _scan_unique_c
+except ImportError:# pragma: no cover
+    _scan_unique_c = None
+blocksize = 1024
+"""int: number of SOAP vectors whose distances to the unique set are computed
+in a single matrix product while finding and classifying unique LAEs.
+"""
+
+def _scan_unique(NP, Psq, Pn, cand, eps):
+    """Sequentially filters the candidate rows of `NP` so that only those that
+    are not similar to an earlier *kept* candidate remain.
+
+    .. note:: By the triangle inequality, two vectors whose norms differ by
+      more than `eps` can't be within `eps` of each other; their dot product is
+      skipped.
+
+    Args:
+        NP (numpy.ndarray): matrix of SOAP vectors for the grain boundary.
+        Psq (numpy.ndarray): squared norms of the rows in `NP`.
+        Pn (numpy.ndarray): norms of the rows in `NP`.
+        cand (numpy.ndarray): of `int` row indices to consider, in order.
+        eps (float): cutoff for deciding whether two vectors are unique.
+
+    Returns:
+        numpy.ndarray: of the row indices in `cand` that were kept.
+    """
+    eps2 = eps**2
+    keep = []
+    for i in cand:
+        if len(keep) > 0:
+            kept = np.array(keep)
+            near = kept[np.abs(Pn[kept] - Pn[i]) <= eps]
+            if len(near) > 0:
+                Dn = Psq[i] + Psq[near] - 2*np.dot(NP[near], NP[i])
+                if np.any(Dn < eps2):
+                    continue
+        keep.append(i)
+    return np.array(keep, dtype=np.int64)
+
+def _scan_unique_kernel(NP, Psq, Pn, cand, eps):# pragma: no cover
+    """Compiled equivalent of :func:`_scan_unique`; the dot products are
+    written out so that numba doesn't need a BLAS binding.
+    """
+    eps2 = eps**2
+    keep = np.empty(len(cand), dtype=np.int64)
+    k = 0
+    for c in range(len(cand)):
+        i = cand[c]
+        unique = True
+        for j in range(k):
+            m = keep[j]
+            if abs(Pn[i] - Pn[m]) > eps:
+                continue
+            dot = 0.
+            for s in range(NP.shape[1]):
+                dot += NP[i,s]*NP[m,s]
+            if Psq[i] + Psq[m] - 2*dot < eps2:
+                unique = False
+                break
+        if unique:
+            keep[k] = i
+            k += 1
+    return keep[:k]
+
+#Prefer the Cython extension (no JIT warmup) when it was built, then numba.
+if _scan_unique_c is not None:# pragma: no cover
+    _scan_unique = _scan_unique_c
+elif njit is not None:
+    _scan_unique = njit(cache=True)(_scan_unique_kernel)
+
+def _parse_gb(parser, gbpath, kwargs):# pragma: no cover
+    """Parses a raw GB file and constructs its :class:`GrainBoundary`. This is
+    module-level so that it can run in worker processes.
+
+    Args:
+        parser: class used to parse the raw GB file; see
+          :meth:`GrainBoundaryCollection.load`.
+        gbpath (str): path to the raw GB file.
+        kwargs (dict): keyword arguments passed to the `gb` method of `parser`.
+    """
+    return parser(gbpath).gb(**kwargs)
+
+def _distinct_rows(A):
+    """Finds the exact duplicate rows in a matrix.
+
+    .. note:: Each row is viewed as a single opaque byte string, so the sort
+      compares raw bytes; `-0.` and `0.` are (harmlessly) treated as distinct.
+
+    Args:
+        A (numpy.ndarray): matrix to find distinct rows in.
+
+    Returns:
+        tuple: of `(first, inverse)` where `first` has the (sorted) row indices
+        of the first occurrence of each distinct row in `A` and `inverse` has
+        the position in `first` of the copy of each row in `A`.
+    """
+    A = np.ascontiguousarray(A)
+    rowtype = np.dtype((np.void, A.dtype.itemsize*A.shape[1]))
+    _, first, inverse = np.unique(A.view(rowtype).reshape(-1),
+                                  return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return first[order], rank[inverse.reshape(-1)]
+
+class UniqueSet(object):
+    """Contiguous, growable matrix of the unique SOAP vectors found by
+    :meth:`GrainBoundaryCollection.uniquify`.
+
+    Args:
+        seed (numpy.ndarray): first unique SOAP vector in the set.
+        key (tuple): of `(PID, VID)` identifying the `seed` vector.
+        capacity (int): number of rows to allocate initially; the storage is
+          doubled each time it fills up.
+
+    Attributes:
+        mat (numpy.ndarray): the first :attr:`n` rows are the unique vectors;
+          the remaining rows are spare capacity.
+        keys (list): of `(PID, VID)` identifiers for each row in :attr:`mat`.
+        sqnorms (numpy.ndarray): squared L2 norms of the rows in :attr:`mat`.
+        n (int): number of unique vectors in the set.
+    """
+    def __init__(self, seed, key, capacity=blocksize):
+        seed = np.asarray(seed, dtype=np.float64)
+        self.mat = np.empty((capacity, len(seed)))
+        self.sqnorms = np.empty(capacity)
+        self.keys = []
+        self.n = 0
+        self.append(seed, key)
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def U(self):
+        """Returns the matrix of unique vectors; shape `(n, S)`.
+        """
+        return self.mat[:self.n]
+
+    @property
+    def Usq(self):
+        """Returns the squared norms of the rows in :attr:`U`.
+        """
+        return self.sqnorms[:self.n]
+
+    def append(self, vec, key, sq=None):
+        """Adds a new unique vector to the set.
+
+        Args:
+            vec (numpy.ndarray): SOAP vector to add.
+            key (tuple): of `(PID, VID)` identifying `vec`.
+            sq (float): squared norm of `vec` if it is already known.
+        """
+        if self.n == len(self.mat):
+            mat = np.empty((2*len(self.mat), self.mat.shape[1]))
+            mat[:self.n] = self.U
+            sqnorms = np.empty(2*len(self.mat))
+            sqnorms[:self.n] = self.Usq
+            self.mat, self.sqnorms = mat, sqnorms
+
+        self.mat[self.n] = vec
+        self.sqnorms[self.n] = np.dot(vec, vec) if sq is None else sq
+        self.keys.append(key)
+        self.n += 1
 
 class GrainBoundaryCollection(OrderedDict):
     """Represents a collection of grain boundaries and the unique environments
@@ -98,8 +267,10 @@ class GrainBoundaryCollection(OrderedDict):
             name (str): name of the property to build the vector for.
         """
         if name in self.properties:
+            #`map` over the bound lookup gathers the values in GB order without
+            #running any python bytecode per GB.
             values = self.properties[name]
-            return np.array([values[gbid] for gbid in self])
+            return np.array(list(map(values.__getitem__, self)))
         else:
             values = []
             scalar = False
@@ -143,47 +314,61 @@ class GrainBoundaryCollection(OrderedDict):
             self.properties[name] = values
             return
 
-        #Extract the gbids directly from the first column before we do the array
-        #loading.
-        pdict = {}
-        iskip = 0
-        with open(filename) as f:
-            for line in f:
-                if iskip < skip:
-                    continue
-                
-                if delimiter is None:
-                    rvals = line.split()
-                else:
-                    rvals = line.split(delimiter)
-
-                gbid = rvals[0]
-                pval = cast(rvals[colindex])
-                pdict[gbid] = pval
+        #Read the gbid and value columns as strings in a single pass; the gbids
+        #have to stay strings to match the collection keys.
+        raw = np.loadtxt(filename, dtype=str, delimiter=delimiter,
+                         skiprows=skip, usecols=(0, colindex), ndmin=2)
+        if cast in (float, int):
+            pvals = raw[:,1].astype(cast).tolist()
+        else:
+            pvals = [cast(v) for v in raw[:,1].tolist()]
 
-        self.properties[name] = pdict
+        self.properties[name] = dict(zip(raw[:,0].tolist(), pvals))
         
     def _find_gbs(self):
 
         """Finds all the GBs in the root directory using the regex.
         """
-        from os import walk
-        allfiles = []
-        for (dirpath, dirnames, filenames) in walk(self.root):
-            allfiles.extend(filenames)
-            break
-
-        for fname in sorted(allfiles, key=self._sortkey, reverse=self._reverse):
-            if self._rxgbid is not None:
+        try:
+            from os import scandir
+        except ImportError:# pragma: no cover
+            #Python 2 only has scandir through the backport package.
+            try:
+                from scandir import scandir
+            except ImportError:
+                scandir = None
+
+        if scandir is not None:
+            #The directory entries already know their type, so this avoids a
+            #`stat` call per file.
+            allfiles = [e.name for e in scandir(self.root) if e.is_file()]
+        else:
+            from os import listdir
+            allfiles = [f for f in listdir(self.root)
+                        if path.isfile(path.join(self.root, f))]
+
+        #Match the regex before sorting so that we only sort the GB files.
+        if self._rxgbid is not None:
+            matches = []
+            for fname in allfiles:
                 gbmatch = self._rxgbid.match(fname)
                 if gbmatch:
                     try:
-                        gbid = gbmatch.group("gbid")
-                        self.gbfiles[gbid] = path.join(self.root, fname)
+                        matches.append((fname, gbmatch.group("gbid")))
                     except IndexError:# pragma: no cover
                         pass
-            else:
-                self.gbfiles[fname] = path.join(self.root, fname)
+        else:
+            matches = [(fname, fname) for fname in allfiles]
+
+        #`sorted` evaluates the key once per file (not per comparison), and
+        #the regex has already been applied, so nothing is re-parsed here.
+        if self._sortkey is None:
+            from operator import itemgetter
+            key = itemgetter(0)
+        else:
+            key = lambda m: self._sortkey(m[0])
+        for fname, gbid in sorted(matches, key=key, reverse=self._reverse):
+            self.gbfiles[gbid] = path.join(self.root, fname)
 
         msg.info("Found {} grain boundaries.".format(len(self.gbfiles)))
 
@@ -197,6 +382,9 @@ class GrainBoundaryCollection(OrderedDict):
           :class:`GrainBoundary` instances, in the sorted order that they were
           discovered.
 
+        .. note:: If :data:`gblearn.base.nprocs` is set, the GB files are
+          parsed in that many processes; `parser` must then be picklable.
+
         Args:
             parser: object used to parse the raw GB file. Defaults to
               :class:`gblearn.lammps.Timestep`. Class should have a method `gb`
@@ -209,24 +397,51 @@ class GrainBoundaryCollection(OrderedDict):
             parser = Timestep
         kwargs["soapargs"] = self.soapargs
         kwargs["padding"] = self.soapargs["rcut"]*2
-            
-        for gbid, gbpath in tqdm(self.gbfiles.items()):
-            t = parser(gbpath)
-            gb = t.gb(**kwargs)
-            self[gbid] = gb
+
+        from gblearn.base import nprocs
+        if nprocs is not None:
+            from multiprocessing import Pool
+            mpool = Pool(nprocs)
+            compute = [(gbid, mpool.apply_async(_parse_gb,
+                                                (parser, gbpath, kwargs)))
+                       for gbid, gbpath in self.gbfiles.items()]
+            for gbid, result in tqdm(compute):
+                self[gbid] = result.get()
+            mpool.close()
+            mpool.join()
+        else:
+            for gbid, gbpath in tqdm(self.gbfiles.items()):
+                self[gbid] = _parse_gb(parser, gbpath, kwargs)
 
     def soap(self):
         """Calculates the SOAP vector matrix for the atomic environments at
         each grain boundary.
+
+        .. note:: If :data:`gblearn.base.nprocs` is set, the GBs are
+          distributed over that many processes. The matrices are returned to
+          this process and saved to the store from here.
         """
         P = self.store.P
 
         if len(P) == len(self):
             #No need to recompute if the store has the result.
             return P
-            
-        for gbid, gb in tqdm(self.items()):
-            P[gbid] = gb.soap(cache=False)
+
+        from gblearn.base import nprocs
+        if nprocs is not None:
+            from multiprocessing import Pool
+            from gblearn.decomposition import _multiproc_execute
+            mpool = Pool(nprocs)
+            compute = [(gbid, mpool.apply_async(_multiproc_execute,
+                                                (gb, "soap", (False,))))
+                       for gbid, gb in self.items()]
+            for gbid, result in tqdm(compute):
+                P[gbid] = result.get()
+            mpool.close()
+            mpool.join()
+        else:
+            for gbid, gb in tqdm(self.items()):
+                P[gbid] = gb.soap(cache=False)
             
     @property
     def P(self):
@@ -247,12 +462,16 @@ class GrainBoundaryCollection(OrderedDict):
         P = self.P
         
         if result is None and len(P) > 0:
-            soaps = []
-            for gbid in P.gbids:
+            #Each GB's column sum is written straight into its row of the
+            #result; the result is allocated once we know the SOAP dimension.
+            #The GBs have different numbers of atoms, so they can't be
+            #stacked into a single reduction.
+            for i, gbid in enumerate(P.gbids):
                 with P[gbid] as Pi:
-                    soaps.append(np.sum(Pi, axis=0))
+                    if result is None:
+                        result = np.empty((len(P.gbids), Pi.shape[1]))
+                    np.einsum('ij->j', Pi, dtype=np.float64, out=result[i])
 
-            result = np.vstack(soaps)
             self.store.ASR = result
 
         return result
@@ -274,15 +493,22 @@ class GrainBoundaryCollection(OrderedDict):
             U[eps] = result
             self.store.U = U
 
-	#Just grab the atom ids from each list and then assign that
-	#particular atom the corresponding unique signature. Note that
-	#each unique signature atom list has the unique signature as the
-	#first element, which is why the range starts at 1.
+        #Just grab the atom ids from each list and then assign those atoms
+        #the index of the corresponding unique signature. Note that each
+        #unique signature atom list has the unique signature as the first
+        #element, which is why the slice starts at 1. LAEs that were dropped
+        #from `U` for not being used only have that first element.
+        keys = list(result["U"].keys())
+        uidx = {u: ui for ui, u in enumerate(keys)}
         for gbid in self.gbfiles:
-            LAEs = result["GBs"][gbid]
-            for u, elist in LAEs.items():
-	        for PID, VID in elist[1:]:
-                    self[gbid].LAEs[VID] = u
+            gb = self[gbid]
+            if gb.LAE_ids is None:
+                gb.LAE_ids = np.full(len(gb), -1, dtype=np.int32)
+            gb.LAE_keys = keys
+            for u, elist in result["GBs"][gbid].items():
+                if len(elist) > 1:
+                    VIDs = [VID for PID, VID in elist[1:]]
+                    gb.LAE_ids[VIDs] = uidx[u]
                 
         return result
     
@@ -316,34 +542,35 @@ class GrainBoundaryCollection(OrderedDict):
         if self.seed is None:
             raise ValueError("Cannot uniquify LAEs without a seed LAE.")
         
-        U = OrderedDict()
-	U[('0', 0)] = self.seed
+        U = UniqueSet(self.seed, ('0', 0))
+        #Squared norms and distinct rows of each GB's SOAP matrix; these are
+        #needed by both passes.
+        rowinfo = {}
         
-	for gbid in tqdm(self.gbfiles):
+        for gbid in tqdm(self.gbfiles):
             with self.P[gbid] as NP:
-                self._uniquify(NP, gbid, U, eps)
+                rowinfo[gbid] = self._uniquify(NP, gbid, U, eps)
 
         #Now that we have the full list of unique environments, go through a
         #second time and classify every vector in each GB.
-        used = {k: False for k in U}
-	for gbid in tqdm(self.gbfiles):
+        used = np.zeros(len(U), dtype=bool)
+        for gbid in tqdm(self.gbfiles):
             with self.P[gbid] as NP:
-                LAEs = self._classify(NP, gbid, U, eps, used)      			
-            	result["GBs"][gbid] = LAEs
-
-        #Now, remove any LAEs from U that didn't get used. We shouldn't really
-        #have many of these.
-        for k, v in used.items():
-            if not v:# pragma: no cover
-                del U[k]
-                
-        #Populate the result dict with the final unique LAEs. We want to store
-        #these ordered by similarity to the seed U.
-        from gblearn.soap import S
-        from operator import itemgetter
-        K = {u: S(v, self.seed) for u, v in U.items()}
-        Us = OrderedDict(sorted(K.items(), key=itemgetter(1), reverse=True))
-        result["U"] = OrderedDict([(u, U[u]) for u in Us])
+                LAEs = self._classify(NP, gbid, U, eps, used, *rowinfo[gbid])
+                result["GBs"][gbid] = LAEs
+
+        #Now, remove any LAEs from U that didn't get used (we shouldn't really
+        #have many of these) and populate the result dict with the final unique
+        #LAEs. We want to store these ordered by similarity to the seed U. The
+        #ordering is the same for squared distances and the stable sort keeps
+        #ties in the order they were found.
+        kept = np.where(used)[0]
+        seed = U.U[0]
+        D = U.Usq[kept] + U.Usq[0] - 2*np.dot(U.U[kept], seed)
+        order = kept[np.argsort(-D, kind="mergesort")]
+        vecs = U.U[order]
+        result["U"] = OrderedDict([(U.keys[ui], vecs[i])
+                                   for i, ui in enumerate(order)])
         return result
                 
     def _uniquify(self, NP, gbid, uni, eps):
@@ -353,66 +580,120 @@ class GrainBoundaryCollection(OrderedDict):
         
         .. note:: This version was includes refactoring by Jonathan Priedemann.
 
+        .. note:: The SOAP distances (see :func:`gblearn.soap.S`) to the unique
+          vectors are computed for blocks of :data:`blocksize` rows at a time
+          using a single matrix product. They are always computed in double
+          precision, even though the SOAP matrices are stored in single
+          precision, because the squared norms cancel almost exactly for
+          similar vectors.
+
+        .. note:: Only the first of any *exactly* duplicated rows in `NP` is
+          considered; the copies are at distance zero from it, so they can
+          never be unique.
+
         Args:
             NP (numpy.ndarray): matrix of SOAP vectors for the grain boundary.
             gbid (str): id of the grain boundary in the publication set.
-            uni (dict): keys are `tuple` of (PID, VID) with `PID` the
+            uni (UniqueSet): SOAP vectors already found to be unique for some
+              value of `eps`, keyed by `tuple` of (PID, VID) with `PID` the
               publication Id of the grain boundary and `VID` the id of the SOAP
-              vector in that GBs descriptor matrix. Value is the actual SOAP
-              vector already found to be unique for some value of `eps`.
+              vector in that GBs descriptor matrix. It is extended as new
+              unique vectors are found.
             eps (float): cutoff value for deciding whether two vectors are unique.
         
         Returns:
-            dict: keys are `tuple` of (PID, VID) linked to `uni`; values are a
-            list of `tuple` (PID, VID) of vectors similar to the key.
-        """
-        from gblearn.soap import S
-        for i in range(len(NP)):
-	    Pv = NP[i,:]
-	    for u in list(uni.keys()):
-		uP = uni[u]
-		K = S(Pv, uP)
-		if K < eps:
-                    #This vector already has at least one possible classification
-        	    break
-	    else:
-		uni[(gbid, i)] = Pv
-
-    def _classify(self, NP, PID, uni, eps, used):
+            tuple: of `(Psq, first, inverse)` where `Psq` has the squared norms
+            of the rows in `NP`; `first` and `inverse` describe its distinct
+            rows (see :func:`_distinct_rows`).
+        """
+        #Converting to double precision is exact, so the duplicates are found
+        #in the (usually single precision) stored matrix, which has half the
+        #bytes to sort.
+        first, inverse = _distinct_rows(NP)
+        NP = np.ascontiguousarray(NP, dtype=np.float64)
+        Psq = np.einsum('ij,ij->i', NP, NP)
+        Pn = np.sqrt(Psq)
+        eps2 = eps**2
+        #Rows that are already known to be within `eps` of some unique vector;
+        #they can't be unique, so later blocks skip them.
+        done = np.zeros(len(NP), dtype=bool)
+        for start in range(0, len(first), blocksize):
+            stop = start + blocksize
+            rows = first[start:stop]
+            rows = rows[~done[rows]]
+            if len(rows) == 0:
+                continue
+            
+            #Compare squared distances so that round-off can't produce the
+            #square root of a (tiny) negative number.
+            D = (Psq[rows,None] + uni.Usq[None,:] -
+                 2*np.dot(NP[rows], uni.U.T))
+            cand = rows[~np.any(D < eps2, axis=1)]
+            #The remaining vectors might still be similar to one another.
+            new = _scan_unique(NP, Psq, Pn, cand, eps)
+            for i in new:
+                uni.append(NP[i,:], (gbid, int(i)), Psq[i])
+
+            if len(new) > 0 and stop < len(first):
+                #The rows are sorted, so this slice covers all the remaining
+                #distinct rows (and some duplicates, which are skipped anyway).
+                rest = slice(first[stop], None)
+                Dn = (Psq[rest,None] + Psq[None,new] -
+                      2*np.dot(NP[rest], NP[new].T))
+                done[rest] |= np.any(Dn < eps2, axis=1)
+
+        return Psq, first, inverse
+
+    def _classify(self, NP, PID, uni, eps, used, Psq, first, inverse):
         """Runs through the collection a second time to reclassify each
         environment according to the most-similar unique LAE identified in
         :meth:`_uniquify`.
+
+        Args:
+            uni (UniqueSet): the complete set of unique SOAP vectors.
+            used (numpy.ndarray): of `bool` flags for each vector in `uni`; set
+              to True for those that are the most similar to some row in `NP`.
+            Psq (numpy.ndarray): squared norms of the rows in `NP`.
+            first (numpy.ndarray): indices of the distinct rows in `NP`.
+            inverse (numpy.ndarray): position in `first` of each row's copy.
         """
-        from gblearn.soap import S
-        result = {}
-        
-	for i in range(len(NP)):
-	    Pv = NP[i,:]
-	    K0 = 1.0 #Lowest similarity kernel among all unique vectors.
-	    U0 = None #Key of the environment corresponding to K0
-            
-	    for u, uP in uni.items():
-		if u not in result:
-                    result[u] = [u]
-            	K = S(Pv, uP)
-
-		if K < eps:
-                    #These vectors are considered to be equivalent. Store the
-                    #equivalency in the result.
-        	    if K < K0:
-			K0 = K
-			U0 = u
+        NP = np.ascontiguousarray(NP, dtype=np.float64)
+        keys = uni.keys
+        result = {u: [u] for u in keys}
+        eps2 = eps**2
+
+        #Exact duplicates have the same most similar unique vector, so only
+        #the distinct rows are compared.
+        imin = np.empty(len(first), dtype=np.intp)
+        Dmin = np.empty(len(first))
+        for start in range(0, len(first), blocksize):
+            rows = first[start:start + blocksize]
+            block = slice(start, start + len(rows))
+            D = Psq[rows,None] + uni.Usq[None,:] - 2*np.dot(NP[rows], uni.U.T)
+            #Index of the most similar unique vector for each row.
+            imin[block] = np.argmin(D, axis=1)
+            Dmin[block] = D[np.arange(len(D)), imin[block]]
+        imin = imin[inverse]
+        Dmin = Dmin[inverse]
+
+        matched = Dmin < eps2
+        for i in np.where(~matched)[0]:# pragma: no cover
+            #This is just a catch warning; it should never happen in
+            #practice.
+            wmsg = "There was an unclassifiable SOAP vector: {}"
+            msg.warn(wmsg.format((PID, int(i))))
+
+        #Group the rows by their unique vector; the stable sort keeps the
+        #rows of each group in order.
+        rows = np.where(matched)[0]
+        uis = imin[matched]
+        order = np.argsort(uis, kind="mergesort")
+        ugroups, gfirst = np.unique(uis[order], return_index=True)
+        for ui, VIDs in zip(ugroups, np.split(rows[order], gfirst[1:])):
+            result[keys[ui]].extend([(PID, VID) for VID in VIDs.tolist()])
+        used[ugroups] = True
                 
-	    if K0 < eps:
-		result[U0].append((PID, i))
-		used[U0] = True
-	    else:# pragma: no cover
-                #This is just a catch warning; it should never happen in
-                #practice.
-                wmsg = "There was an unclassifiable SOAP vector: {}"
-                msg.warn(wmsg.format((PID, i)))
-                
-   	return result
+        return result
 
     def features(self, eps):
         """Calculates the feature descriptor for the given `eps` value and
@@ -457,15 +738,21 @@ class GrainBoundaryCollection(OrderedDict):
         if result is None:
             U = self.U(eps)
         
-            #Next, loop over each GB and count how many of each kind it has.
-            result = np.zeros((len(self), len(U["U"])))
-            for gbi, gbid in enumerate(self):
-                for ui, uid in enumerate(U["U"]):
-                    result[gbi,ui] = self[gbid].LAEs.count(uid)
-                #Normalize by the total number of atoms of each type
-                N = np.sum(result[gbi,:])
-                assert N == len(self[gbid])
-                result[gbi,:] /= N
+            #Next, count how many of each kind every GB has; the atoms are
+            #already labeled by their column in the result. Offsetting the
+            #labels of each GB by its row lets a single bincount fill the
+            #whole matrix.
+            nU = len(U["U"])
+            ids = [self[gbid].LAE_ids for gbid in self]
+            lens = np.array([len(gbids) for gbids in ids])
+            offsets = np.repeat(np.arange(len(ids))*nU, lens)
+            counts = np.bincount(np.concatenate(ids) + offsets,
+                                 minlength=len(ids)*nU)
+            result = counts.reshape((len(ids), nU)).astype(float)
+            #Normalize by the total number of atoms of each type
+            N = np.sum(result, axis=1)
+            assert np.all(N == lens)
+            result /= N[:,None]
 
             LER[eps] = result
             self.store.LER = LER
@@ -546,6 +833,9 @@ class GrainBoundary(object):
         soapargs (dict): keyword arguments to pass to the constructor of the
           :class:`~gblearn.soap.SOAPCalculator` that will be used to calculate
           the `P` matrix for this GB.
+        copy (bool): when False, `xyz` and the `extras` arrays are used as-is
+          instead of being copied. Only pass False when the caller hands over
+          freshly allocated arrays that it won't modify afterwards.
 
     Attributes:
         lattice (numpy.ndarray): array of lattice vector for the grain boundary
@@ -554,17 +844,21 @@ class GrainBoundary(object):
         calculator (~gblearn.soap.SOAPCalculator): calculator for getting the
           SOAP vector matrix for this GB.
         Z (int or list): element code(s) for the atomic species.
-        P (numpy.ndarray): SOAP vector matrix; shape `(N, S)`, where `N` is the
-          number of atoms at the boundary and `S` is the dimensionality of the
-          SOAP vector space (which varies with SOAP parameters).
-        LAEs (list): of tuple with `(PID, VID)` corresponding to the unique LAE
-          number in the collection's global unique set.
+        P (numpy.ndarray): single precision SOAP vector matrix; shape `(N, S)`,
+          where `N` is the number of atoms at the boundary and `S` is the
+          dimensionality of the SOAP vector space (which varies with SOAP
+          parameters).
+        LAE_ids (numpy.ndarray): of `int` for each atom; the index in
+          :attr:`LAE_keys` of the unique LAE that the atom's environment
+          belongs to, or `-1` if it hasn't been classified.
+        LAE_keys (list): of `(PID, VID)` identifiers of the unique LAEs in the
+          collection's global unique set.
     """
     def __init__(self, xyz, types, box, Z, extras=None, selectargs=None,
-                 makelat=True, params=None, **soapargs):
+                 makelat=True, params=None, copy=True, **soapargs):
         from gblearn.soap import SOAPCalculator
         from gblearn.lammps import make_lattice
-        self.xyz = xyz.copy()
+        self.xyz = xyz.copy() if copy else np.asarray(xyz)
         self.types = types
         self.params = params.copy() if params is not None else {}
         
@@ -577,7 +871,8 @@ class GrainBoundary(object):
             
         self.calculator = SOAPCalculator(**soapargs)
         self.Z = Z
-        self.LAEs = None
+        self.LAE_ids = None
+        self.LAE_keys = None
 
         #For the selection, if padding is present in the dictionary, reduce the
         #padding by half so that all the atoms at the GB get a full SOAP
@@ -587,14 +882,14 @@ class GrainBoundary(object):
             self.selectargs["padding"] /= 2
 
         if extras is not None:
-            self.extras = extras.keys()
+            self.extras = list(extras.keys())
             for k, v in extras.items():
                 if not hasattr(self, k):
-                    target = v.copy()
+                    target = v.copy() if copy else v
                     if isinstance(target, FortranArray):
-                        setattr(self, k, v.copy().T)
+                        setattr(self, k, target.T)
                     else:
-                        setattr(self, k, v.copy())
+                        setattr(self, k, target)
                 else:
                     msg.warn("Cannot set extra attribute `{}`; "
                              "already exists.".format(k))
@@ -618,6 +913,24 @@ class GrainBoundary(object):
     def __len__(self):
         return len(self.xyz)
 
+    @property
+    def LAEs(self):
+        """Returns a list of tuple with `(PID, VID)` corresponding to the unique
+        LAE number in the collection's global unique set for each atom. Atoms
+        that haven't been classified have `(None, None)`.
+        """
+        if self.LAE_ids is None:
+            return None
+        unset = (None, None)
+        return [self.LAE_keys[ui] if ui >= 0 else unset for ui in self.LAE_ids]
+
+    def __getstate__(self):
+        #The quippy atoms can't be pickled (e.g., to send the GB to another
+        #process); they are rebuilt from the positions when needed.
+        state = self.__dict__.copy()
+        state["_atoms"] = None
+        return state
+
     @property
     def NP(self):
         """Returns the *normalized* P matrix where each row is normalized by its
@@ -625,10 +938,14 @@ class GrainBoundary(object):
         """
         if self._NP is None:
             P = self.soap()
-            pself = np.array([np.dot(p, p) for p in P])
-            self._NP = np.array([P[i,:]/np.sqrt(pself[i])
-                                 for i in range(len(P))
-                                 if pself[i] > 0])
+            pself = np.einsum('ij,ij->i', P, P)
+            mask = pself > 0
+            #The boolean index already gives us a fresh copy, so normalize it
+            #in place rather than allocating a second `(N, S)` array. `P`
+            #itself is cached (or memory-mapped) and must not change.
+            NP = P[mask]
+            np.divide(NP, np.sqrt(pself[mask])[:,None], out=NP)
+            self._NP = NP
         return self._NP
 
     @property
@@ -637,20 +954,30 @@ class GrainBoundary(object):
         grain boundary.
         """
         if self._K is None:
+            from scipy.linalg.blas import get_blas_funcs
             NP = self.NP
-            self._K = np.dot(NP, NP.T)
+            #`syrk` only computes the upper triangle of the symmetric product
+            #(half the FLOPs of a full `dot`); passing the transpose avoids
+            #a copy into Fortran order.
+            syrk = get_blas_funcs("syrk", (NP,))
+            K = syrk(1.0, NP.T, trans=1)
+            K += np.triu(K, 1).T
+            self._K = K
         return self._K
 
     def load(self, attr, filepath):
         """Loads a SOAP matrix `P` for this GB from serialized file.
 
+        .. note:: The file is memory-mapped read-only, so only the rows that are
+          actually used get paged in.
+
         Args:
             attr (str): attribute to load from file; one of ['P', 'R'].
             filepath (str): full path to the file to load.
         """
         from os import path
         if path.isfile(filepath):
-            setattr(self, attr, np.load(filepath))
+            setattr(self, attr, np.load(filepath, mmap_mode='r'))
 
     @property
     def gbids(self):
@@ -697,11 +1024,13 @@ class GrainBoundary(object):
         self.xyz = self.xyz[ids,:]
         if self.types is not None:
             self.types = self.types[ids]
-        self.LAEs = [(None, None) for i in range(len(self.xyz))]
+        self.LAE_ids = np.full(len(self.xyz), -1, dtype=np.int32)
         for k in self.extras:
             current = getattr(self, k)
             if hasattr(current, "__getitem__"):
-                setattr(self, k, np.array(current)[ids])
+                #The fancy index already makes a copy; `np.array` would copy
+                #the whole untrimmed array first.
+                setattr(self, k, np.asarray(current)[ids])
             
     def soap(self, cache=True):
         """Calculates the SOAP vector matrix for the atomic environments at the
@@ -721,6 +1050,9 @@ class GrainBoundary(object):
                 if ids is not None:
                     P = P[ids,:]
 
+            #Single precision is plenty for the kernel comparisons and halves
+            #the memory (and disk) footprint of the SOAP matrices.
+            P = P.astype(np.float32, copy=False)
             if cache:
                 self.P = P
             else:
@@ -739,8 +1071,14 @@ class GrainBoundary(object):
         if self._atoms is None:
             from quippy.atoms import Atoms
             a = Atoms(lattice=self.lattice)
-            for xyz in self.xyz:
-                a.add_atoms(xyz, self.Z)
+            if isinstance(self.Z, (int, np.integer)):
+                #Add all the atoms in a single call; quippy expects the
+                #positions with shape (3, N).
+                pos = np.asfortranarray(self.xyz.T, dtype=np.float64)
+                a.add_atoms(pos, np.full(len(self.xyz), self.Z, dtype=np.int32))
+            else:
+                for xyz in self.xyz:
+                    a.add_atoms(xyz, self.Z)
             self._atoms = a
         return self._atoms
         
@@ -767,9 +1105,10 @@ class GrainBoundary(object):
             with open(filepath, 'w') as f:
                 f.write("{0:d}\n".format(len(self.xyz)))
                 f.write('Lattice="{}" Properties=species:S:1:pos:R:3\n'.format(LVs))
+                #Format the plain floats and write all the atoms at once.
                 afmt = "{0}    {1:.5f}    {2:.5f}    {3:.5f}\n"
-                for xyz in self.xyz:
-                    f.write(afmt.format(species, *xyz))
+                f.write(''.join([afmt.format(species, *xyz)
+                                 for xyz in self.xyz.tolist()]))
         else:
             import quippy.cinoutput as qcio
             out = qcio.CInOutputWriter(filepath)
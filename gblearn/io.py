@@ -17,7 +17,8 @@ class DiskCollection(object):
     """For large grain boundary collections, it may not be possible to keep all
     SOAP matrices and their derivatives in memory at the same time for
     processing. In these cases, it is preferable to read a matrix in, process
-    it, and then delete it from memory right away.
+    it, and then delete it from memory right away. The array files are
+    memory-mapped read-only so that only the pages that are touched are read.
 
     Args:
         root (str): path to the folder where the array files are stored.
@@ -66,7 +67,7 @@ class DiskCollection(object):
             if not path.isfile(target):
                 yield None
             else:
-                result = np.load(target)
+                result = np.load(target, mmap_mode='r')
                 if not self.restricted:# pragma: no cover
                     self.cache[key] = result
                 yield result
@@ -363,8 +364,7 @@ class ResultStore(object):
             return {}
         
         from glob import glob
-        from gblearn.utility import chdir
-        from cPickle import load
+        from gblearn.utility import chdir, load_pickle
         
         result = {}
         rpath = getattr(self, attr + '_')
@@ -377,7 +377,7 @@ class ResultStore(object):
                 seps = pkl[:-4]
                 eps = float(seps)
                 with open(pkl, 'rb') as f:
-                    result[eps] = load(f)
+                    result[eps] = load_pickle(f)
 
         setattr(self, '_' + attr, result)
         return result
@@ -404,12 +404,15 @@ class ResultStore(object):
         if not path.isdir(target):
             mkdir(target)
             
-        from cPickle import dump
+        from six.moves.cPickle import dump
         for eps, utup in value.items():
             upath = path.join(target, "{0:.5f}.pkl".format(eps))
             if not path.isfile(upath):
+                #The binary protocols store the numpy arrays as raw bytes
+                #instead of escaped text, which is much faster to load.
+                #Protocol 2 is the newest one that python 2.7 can still read.
                 with open(upath, 'wb') as f:
-                    dump(utup, f)
+                    dump(utup, f, 2)
 
     @property
     def ASR(self):
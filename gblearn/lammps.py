@@ -216,7 +216,8 @@ class Timestep(object):
             x = None
         result = GrainBoundary(self.xyz[ids,:], self.types[ids],
                                self.box, Z, extras=x,
-                               selectargs=selectargs, **soapargs)
+                               selectargs=selectargs, copy=False,
+                               **soapargs)
         return result
         
     def gbids(self, method="median", pattr=None, **kwargs):
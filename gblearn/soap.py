@@ -38,6 +38,18 @@ class SOAPCalculator(object):
         self.lmax = lmax
         self.sigma = sigma
         self.trans_width = trans_width
+        self._descriptors = {}
+        """dict: keys are `int` element numbers; values are the
+        :class:`quippy.descriptors.Descriptor` for that central atom type, so
+        that the radial basis setup is only done once per element.
+        """
+
+    def __getstate__(self):
+        #The quippy descriptors can't be pickled; they are recreated on the
+        #first call to :meth:`calc` after unpickling.
+        state = self.__dict__.copy()
+        state["_descriptors"] = {}
+        return state
 
     def calc(self, atoms, central, basis=None):
         """Calculates a SOAP vector for the specified species and atomic
@@ -47,8 +59,9 @@ class SOAPCalculator(object):
             atoms (quippy.Atoms): list of atoms to calculate the vector for.
             central (int): integer element number to set as the central atom type
               for the SOAP calculation.
-            basis (list): of `int` defining which of the atoms in the *conventional*
-              unit cell should be retained as a unique part of the basis.
+            basis (list or numpy.ndarray): of `int` defining which of the atoms
+              in the *conventional* unit cell should be retained as a unique
+              part of the basis.
         """
         import quippy
         import quippy.descriptors as descriptor
@@ -56,9 +69,12 @@ class SOAPCalculator(object):
                    "atom_sigma={3:.2f} n_species=1 species_Z={{{4:d}}} "
                    "Z={4:d} trans_width={5:.2f} normalise=F")
         Z = np.unique(atoms.get_atomic_numbers())[0]
-        D = descriptor.Descriptor
-        descZ = D(descstr.format(self.rcut, self.nmax, self.lmax, self.sigma,
-                                 Z, self.trans_width))
+        if Z not in self._descriptors:
+            D = descriptor.Descriptor
+            self._descriptors[Z] = D(descstr.format(self.rcut, self.nmax,
+                                                    self.lmax, self.sigma, Z,
+                                                    self.trans_width))
+        descZ = self._descriptors[Z]
                 
         atoms.set_cutoff(descZ.cutoff())
         atoms.calc_connect()
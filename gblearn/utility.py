@@ -42,3 +42,17 @@ def _get_reporoot():
 reporoot = _get_reporoot()
 """The absolute path to the repo root on the local machine.
 """
+
+def load_pickle(f):
+    """Loads a pickled object from an open file. Pickles written by python 2
+    that contain numpy arrays are decoded as `latin1` under python 3.
+
+    Args:
+        f (file): open file in binary mode.
+    """
+    from six import PY2
+    from six.moves.cPickle import load
+    if PY2:
+        return load(f)
+    else:
+        return load(f, encoding="latin1")
@@ -78,7 +78,8 @@ class XYZParser(object):
 
         result = GrainBoundary(self.xyz[ids,:], types,
                                self.box, Z, extras=x, makelat=False,
-                               selectargs=selectargs, params=self.atoms.params,
+                               selectargs=selectargs, copy=False,
+                               params=self.atoms.params,
                                **soapargs)
         return result
 
@@ -16,6 +16,15 @@ except ImportError:
     print("warning: pypandoc module not found, could not convert Markdown to RST")
     read_md = lambda f: open(f, 'r').read()
 
+#The compiled uniquify kernels are optional; without Cython, gblearn falls
+#back to numba or NumPy.
+try:
+    from Cython.Build import cythonize
+    ext_modules = cythonize(["gblearn/_classify.pyx"])
+except ImportError:
+    print("warning: Cython not found, the compiled kernels won't be built")
+    ext_modules = []
+
 from os import path
 setup(name='gblearn',
       version='0.2.1',
@@ -34,8 +43,9 @@ setup(name='gblearn',
           "matplotlib"
       ],
       packages=['gblearn'],
+      ext_modules=ext_modules,
       scripts=[],
-      package_data={'gblearn': []},
+      package_data={'gblearn': ['data/*.npz']},
       include_package_data=False,
       classifiers=[
           'Development Status :: 4 - Beta',
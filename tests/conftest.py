@@ -6,3 +6,28 @@ from gblearn.base import testmode
 import matplotlib
 from gblearn.base import testmode
 matplotlib.use("Agg" if testmode else "TkAgg")
+
+@pytest.fixture(scope="session")
+def loadmodel():
+    """Returns a function that loads a text model file with
+    :func:`numpy.loadtxt`. The parsed array is saved to a sibling `.npy` file so
+    that later runs can just memory-map it; the cache is refreshed whenever the
+    text file is newer.
+    """
+    import numpy as np
+    from os import path
+    def _loadmodel(filename):
+        npyfile = filename + ".npy"
+        if (path.isfile(npyfile) and
+            path.getmtime(npyfile) >= path.getmtime(filename)):
+            return np.load(npyfile, mmap_mode='r', allow_pickle=False)
+
+        result = np.loadtxt(filename)
+        try:
+            np.save(npyfile, result)
+        except (IOError, OSError):# pragma: no cover
+            #Read-only checkouts still work; they just parse the text.
+            pass
+        return result
+
+    return _loadmodel
@@ -33,21 +33,120 @@ def test_atoms(elements, models):
     #Finally test the dummy case.
     assert atoms("Dummy") is None
 
-def test_shells(elements, models):
-    """Tests the nearest neighbor shell distances for the elements.
+def test_ase_atoms(elements, models, monkeypatch):
+    """Tests that the ASE fallback (used when quippy isn't installed) builds
+    the same structures and shells as quippy.
     """
-    from gblearn.elements import shells
+    pytest.importorskip("ase")
+    import gblearn.elements as gbe
+    monkeypatch.setattr(gbe, "_qstruct", None)
+    monkeypatch.setattr(gbe, "_lattice_ctors", {})
+    monkeypatch.setattr(gbe, "_atoms", {})
     for e in elements:
-        result = shells(e)
+        a = gbe.atoms(e)
+        modelfile = models("{}.positions.npy".format(e))
+        assert np.allclose(a.positions, np.load(modelfile))
         modelfile = models("{}.shells.npy".format(e))
-        assert np.allclose(result, np.load(modelfile))
+        assert np.allclose(gbe._calc_shells(e, 6.), np.load(modelfile))
+
+def test_shells(elements, models, tmpdir, monkeypatch):
+    """Tests the nearest neighbor shell distances for the elements, both
+    tabulated and calculated.
+    """
+    import gblearn.elements as gbe
+    if gbe._qstruct is None:
+        pytest.importorskip("ase")
+    monkeypatch.setattr(gbe, "_shells_file", str(tmpdir.join("shells.json")))
+    monkeypatch.setattr(gbe, "_shells", None)
+    for e in elements:
+        model = np.load(models("{}.shells.npy".format(e)))
+        assert np.allclose(gbe.shells(e), model)
+        #There are no additional shells between 5.9 and 6.0, so this takes the
+        #live path but should give the same result.
+        assert np.allclose(gbe.shells(e, rcut=5.9), model)
+
+def test_shells_empty(elements, monkeypatch):
+    """Tests the shells for a cutoff below the first neighbor shell, with and
+    without the compiled de-duplication.
+    """
+    import gblearn.elements as gbe
+    if gbe._qstruct is None:
+        pytest.importorskip("ase")
+    for e in elements:
+        assert gbe._calc_shells(e, 2.) == []
+    pyfunc = getattr(gbe._dedup_sorted, "py_func", gbe._dedup_sorted)
+    monkeypatch.setattr(gbe, "_dedup_sorted", pyfunc)
+    for e in elements:
+        assert gbe._calc_shells(e, 2.) == []
+
+def test_dedup_sorted():
+    """Tests that the compiled and interpreted shell de-duplication agree for
+    chains of adjacent keys.
+    """
+    from gblearn.elements import _dedup_sorted
+    pyfunc = getattr(_dedup_sorted, "py_func", _dedup_sorted)
+    for keys, model in [([100, 101, 102, 200], [100, 102, 200]),
+                        (list(range(100, 110)) + [200],
+                         [100, 102, 104, 106, 108, 200])]:
+        keys = np.array(keys, dtype=np.int64)
+        assert np.array_equal(_dedup_sorted(keys, 1), model)
+        assert np.array_equal(pyfunc(keys, 1), model)
+
+def test_shells_cache(tmpdir, monkeypatch):
+    """Tests the on-disk neighbor shells cache and its keys.
+    """
+    import gblearn.elements as gbe
+    monkeypatch.setattr(gbe, "_shells_file",
+                        str(tmpdir.join("cache", "shells.json")))
+    model = {gbe._shells_key("Ni", 5.): [2.48902, 3.52, 4.3111, 4.97803]}
+    monkeypatch.setattr(gbe, "_shells", dict(model))
+    gbe._save_shells()
+    gbe._shells = None
+    gbe._load_shells()
+    assert gbe._shells == model
+
+    #Integer and float cutoffs must share an entry; a different crystal
+    #definition must not.
+    assert gbe._shells_key("Ni", 5) == gbe._shells_key("Ni", 5.)
+    key = gbe._shells_key("Ni", 5.)
+    monkeypatch.setitem(gbe.elements, "Ni", gbe._spec("fcc", 3.6, 28, [0]))
+    assert gbe._shells_key("Ni", 5.) != key
 
 def test_pissnnl(elements, models):
-    """Tests the SOAP vector for each of the elements.
+    """Tests the SOAP vector for each of the elements, both tabulated and
+    calculated.
+    """
+    from gblearn.elements import pissnnl, _calc_pissnnl
+    for e in elements:
+        live = _calc_pissnnl(e, 12, 12, 6.0, 0.5, 0.5)
+        for i, dZ in enumerate(pissnnl(e, dtype=np.float64)):
+            model = np.load(models("{}.pissnnl_{}.npy".format(e, i)))
+            assert np.allclose(dZ, model)
+            assert np.allclose(live[i], model)
+
+def test_pissnnl_batch(elements):
+    """Tests the batched SOAP vectors against the calculated single-element
+    ones.
+    """
+    from gblearn.elements import pissnnl_batch, _calc_pissnnl
+    result = pissnnl_batch(elements, dtype=np.float64)
+    for e in elements:
+        live = _calc_pissnnl(e, 12, 12, 6.0, 0.5, 0.5)
+        assert len(result[e]) == len(live)
+        for dZ, P in zip(result[e], live):
+            assert np.allclose(dZ, P)
+
+def test_precomputed(elements):
+    """Tests that the tabulated shells and SOAP vectors still agree with the
+    live calculation.
     """
-    from gblearn.elements import pissnnl
-    elements = ["Ni", "Cr", "Mg"]
+    from gblearn.elements import (_calc_shells, _calc_pissnnl,
+                                  _load_precomputed)
+    from gblearn._precomputed import (PRECOMPUTED_RCUT, PRECOMPUTED_SHELLS,
+                                      PRECOMPUTED_P)
     for e in elements:
-        for i, dZ in enumerate(pissnnl(e)):
-            modelfile = models("{}.pissnnl_{}.npy".format(e, i))
-            assert np.allclose(dZ, np.load(modelfile))
+        assert np.allclose(_calc_shells(e, PRECOMPUTED_RCUT),
+                           PRECOMPUTED_SHELLS[e])
+    for args, names in PRECOMPUTED_P.items():
+        for dZ, model in zip(_calc_pissnnl(*args), _load_precomputed(names)):
+            assert np.allclose(dZ, model)
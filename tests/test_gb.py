@@ -6,14 +6,23 @@ from os import path
 import numpy as np
 from gblearn.utility import reporoot
     
-@pytest.fixture
-def GBCol(tmpdir):
+def _homer(store):
+    """Returns an (unloaded) GB collection for the `homer` folder.
+
+    Args:
+        store (str): root directory for the collection's result store.
+    """
     from gblearn.gb import GrainBoundaryCollection as GBC
     gbpath = path.join(reporoot, "tests", "homer")
-    root = str(tmpdir.join("homer"))
-    result = GBC("homer", gbpath, root, r"ni.p(?P<gbid>\d+).out",
-                 rcut=3.25, lmax=12, nmax=12, sigma=0.5)
+    return GBC("homer", gbpath, store, r"ni.p(?P<gbid>\d+).out",
+               rcut=3.25, lmax=12, nmax=12, sigma=0.5)
 
+@pytest.fixture(scope="module")
+def loadedGBs():
+    """Parses the GB files in the `homer` folder once for the module; the tests
+    get copies of them through :func:`GBCol`.
+    """
+    result = _homer(None)
     from gblearn.gb import GrainBoundary
     result.load(Z=28, method="cna_z", pattr="c_cna")
     for gbid, gb in result.items():
@@ -21,6 +30,18 @@ def GBCol(tmpdir):
 
     return result
 
+@pytest.fixture
+def GBCol(loadedGBs, tmpdir):
+    """Returns a GB collection with a fresh store and its own copies of the
+    parsed GBs, since the tests trim them and set their LAEs.
+    """
+    from copy import deepcopy
+    result = _homer(str(tmpdir.join("homer")))
+    for gbid, gb in loadedGBs.items():
+        result[gbid] = deepcopy(gb)
+
+    return result
+
 @pytest.fixture(scope="module")
 def GB9(request):
     """Returns the grain boundary atoms from the 9th sample in the
@@ -30,11 +51,12 @@ def GB9(request):
     p9 = Timestep("tests/selection/ni.p9.out")
     return p9.gb(28)
 
-def test_properties(GBCol):
+def test_properties(GBCol, tmpdir):
     """Tests the loading and reading of properties for a GB collection.
     """
-    pdict = {str(i): i + 10.5 for i in range(453, 460)}
-    model = np.array([i + 10.5 for i in range(453, 460)])
+    gbids = np.arange(453, 460)
+    model = gbids + 10.5
+    pdict = dict(zip(map(str, gbids), model.tolist()))
     GBCol.add_property("fromdict", values=pdict)
     assert np.allclose(model, GBCol.get_property("fromdict"))
 
@@ -42,10 +64,25 @@ def test_properties(GBCol):
     GBCol.add_property("fromfile", valfile)
     assert np.allclose(model, GBCol.get_property("fromfile"))
 
+    #Make sure that header rows can be skipped.
+    hdrfile = str(tmpdir.join("energy.csv"))
+    with open(hdrfile, 'w') as f:
+        f.write("gbid,energy\n")
+        for i in range(453, 460):
+            f.write("{},{}\n".format(i, i + 10.5))
+    GBCol.add_property("skipped", hdrfile, delimiter=',', skip=1)
+    assert np.allclose(model, GBCol.get_property("skipped"))
+
 def test_K(GB9):
     """Tests generation of the kernel matrix for the GB.
     """
     K = GB9.K
+    NP = GB9.NP
+    assert K.shape == (len(NP), len(NP))
+    assert np.allclose(K, K.T)
+    assert np.allclose(K, np.dot(NP, NP.T), atol=1e-5)
+    #The rows of NP are normalized, so each LAE is identical to itself.
+    assert np.allclose(np.diag(K), 1., atol=1e-5)
 
 def test_gb(GB9, tmpdir):
     """Tests the basic grain boundary instance attributes and methods
@@ -58,12 +95,50 @@ def test_gb(GB9, tmpdir):
     fxyz = str(tmpdir.join("s9.xyz"))
     GB9.save_xyz(fxyz, "Ni")
 
-    from quippy import Atoms
-    A = Atoms(fxyz)
-    B = Atoms("tests/gb/s9.xyz")
-    assert A.equivalent(B)
+    #Compare the atom count, lattice and positions directly instead of
+    #parsing both files back into quippy.
+    def _read_xyz(filename):
+        import re
+        with open(filename) as f:
+            N = int(f.readline())
+            lattice = re.search(r'Lattice="([^"]+)"', f.readline()).group(1)
+        pos = np.loadtxt(filename, skiprows=2, usecols=(1, 2, 3))
+        return N, np.array(lattice.split(), dtype=float), pos
+
+    for ours, model in zip(_read_xyz(fxyz), _read_xyz("tests/gb/s9.xyz")):
+        assert np.allclose(ours, model)
     
-def _preload_soap(GBCol):
+@pytest.fixture(scope="session")
+def soapmodels(tmpdir_factory):
+    """Returns the model SOAP matrices for the `homer` GBs, shared by all the
+    tests in the session. They are concatenated (once) into a single
+    memory-mapped matrix so that each GB's matrix is a contiguous view of it.
+
+    Returns:
+        tuple: of `(stack, rows)` where `stack` has the SOAP vectors of all
+        the GBs and `rows` is an :class:`~collections.OrderedDict` of the
+        `slice` of `stack` for each `gbid`.
+    """
+    from glob import glob
+    from collections import OrderedDict
+    homer = path.join(reporoot, "tests", "homer")
+    models = OrderedDict()
+    for Pfile in sorted(glob(path.join(homer, "pissnnl.*.npy"))):
+        gbid = path.basename(Pfile).split('.')[1]
+        models[gbid] = np.load(Pfile, mmap_mode='r')
+
+    stackfile = str(tmpdir_factory.mktemp("soap").join("all_pissnnl.npy"))
+    np.save(stackfile, np.concatenate(list(models.values())))
+    stack = np.load(stackfile, mmap_mode='r')
+
+    rows = OrderedDict()
+    start = 0
+    for gbid, model in models.items():
+        rows[gbid] = slice(start, start + len(model))
+        start += len(model)
+    return stack, rows
+
+def _preload_soap(GBCol, soapmodels):
     """Preloads all the SOAP matrices into the GB collection to speed up
     computations.
 
@@ -71,21 +146,22 @@ def _preload_soap(GBCol):
       those that fall within the padding constraints, this function also calls
       :meth:`~gblearn.gb.GrainBoundary.trim` on each grain boundary.
 
+    Args:
+        soapmodels (tuple): result of the :func:`soapmodels` fixture.
+
     Returns:
         int: dimensions of SOAP vectors that are loaded.
     """
     GBCol.restricted = False
     GBCol.store.restricted = False
     GBCol.store.P.restricted = False
-    
+
+    stack, rows = soapmodels
     for gbid, gb in GBCol.items():
-        Pfile = "pissnnl.{}.npy".format(gbid)
-        model = np.load(path.join(GBCol.root, Pfile))
-        GBCol.store.P[gbid] = model
-        N = model.shape[1]
+        GBCol.store.P[gbid] = stack[rows[gbid]]
         gb.trim()
 
-    return N
+    return stack.shape[1]
 
 def test_gbids(GBCol):
     assert list(GBCol.gbfiles.keys()) == list(map(str, range(453, 460)))
@@ -101,6 +177,21 @@ def test_gbids(GBCol):
              ["README.md"])
     assert list(sorted(col.gbfiles.keys())) == sorted(model)
 
+def test_load_nprocs(GBCol, tmpdir):
+    """Tests parsing the GB files for a collection in parallel.
+    """
+    from gblearn.base import set_nprocs
+    col = _homer(str(tmpdir.join("homer-nprocs")))
+    set_nprocs(2)
+    try:
+        col.load(Z=28, method="cna_z", pattr="c_cna")
+    finally:
+        set_nprocs(None)
+
+    assert list(col.keys()) == list(GBCol.keys())
+    for gbid, gb in col.items():
+        assert np.allclose(gb.xyz, GBCol[gbid].xyz)
+
 def test_gbsoap(GBCol):
     """Tests construction of grain boundary objects for each of dump files found
     in the testing directory.
@@ -111,75 +202,151 @@ def test_gbsoap(GBCol):
     for gbid in GBCol:
         with GBCol.P[gbid] as stored:
             Pfile = "pissnnl.{}.npy".format(gbid)
-            model = np.load(path.join(GBCol.root, Pfile))
+            model = np.load(path.join(GBCol.root, Pfile), mmap_mode='r')
             assert np.allclose(stored, model)
 
     #Make sure it doesn't recompute if they're all there.
     assert GBCol.soap() is GBCol.P
 
-def test_ASR(GBCol):
+def test_gbsoap_nprocs(GBCol):
+    """Tests computing the SOAP matrices for the collection in parallel.
+    """
+    from gblearn.base import set_nprocs
+    set_nprocs(2)
+    try:
+        GBCol.soap()
+    finally:
+        set_nprocs(None)
+
+    for gbid in GBCol:
+        with GBCol.P[gbid] as stored:
+            Pfile = "pissnnl.{}.npy".format(gbid)
+            model = np.load(path.join(GBCol.root, Pfile), mmap_mode='r')
+            assert np.allclose(stored, model)
+
+def test_ASR(GBCol, soapmodels):
     """Tests construction of ASR.
     """
     #Speed up the test by pre-loading the SOAP matrices. Their construction is
     #tested separately.
-    N = _preload_soap(GBCol)
+    N = _preload_soap(GBCol, soapmodels)
     ASR = GBCol.ASR               
     assert ASR.shape == (len(GBCol), N)
 
-def test_uniquify(GBCol):
+    #The ASR is just the sum over each GB's block of rows in the stack.
+    stack, rows = soapmodels
+    starts = [rows[gbid].start for gbid in GBCol]
+    model = np.add.reduceat(stack, starts, axis=0, dtype=np.float64)
+    assert np.allclose(ASR, model)
+
+def test_uniquify(GBCol, soapmodels, loadmodel):
     """Tests the unique LAE extraction and GB classification to create the LER.
     """
     #Speed up the test by pre-loading the SOAP matrices. Their construction is
     #tested separately.
-    N = _preload_soap(GBCol)
+    N = _preload_soap(GBCol, soapmodels)
     eps = 0.002500
     with pytest.raises(ValueError):
         U = GBCol.U(eps)
 
     #Now, assign the seed for the perfect FCC lattice
-    seed = np.loadtxt(path.join(reporoot, "tests", "elements", "Ni.pissnnl_seed.txt"))
+    seed = loadmodel(path.join(reporoot, "tests", "elements", "Ni.pissnnl_seed.txt"))
     GBCol.seed = seed
     U = GBCol.U(eps)
 
     #Make sure we found the same unique LAEs as Jonathan verified.
     ukeyfile = path.join(reporoot, "tests", "unique", "soap-keys.txt")
-    modelkeys = np.asarray(np.loadtxt(ukeyfile), dtype=int)
-    for mkey in modelkeys:
-        assert (str(mkey[0]), mkey[1]) in U["U"]
+    modelkeys = np.asarray(loadmodel(ukeyfile), dtype=int)
+    skeys = [(str(mkey[0]), mkey[1]) for mkey in modelkeys]
+    for skey in skeys:
+        assert skey in U["U"]
 
     #Make sure that we didn't mess up the indices or identifiers. The soap
     #vectors for each index that we found should match the model ones.
     uvecfile = path.join(reporoot, "tests", "unique", "soap-vecs.txt")
-    modelvecs = np.loadtxt(uvecfile)
-    for i, mkey in enumerate(modelkeys):
-        skey = (str(mkey[0]), mkey[1])
-        assert np.allclose(modelvecs[i,:], U["U"][skey])
+    modelvecs = loadmodel(uvecfile)
+    ours = np.array([U["U"][skey] for skey in skeys])
+    assert np.allclose(modelvecs, ours)
 
     #Next, check that we are correctly assigning LAEs to the atoms in the GB.
     for gbid, gb in GBCol.items():
         laefile = path.join(reporoot, "tests", "unique", "LAE-{}.txt".format(gbid))
-        model = np.loadtxt(laefile)
-        ids = np.arange(1, len(gb) + 1).reshape((len(gb), 1))
-        ours = np.hstack((ids, gb.xyz, np.array(gb.LAEs, dtype=int)))
+        model = loadmodel(laefile)
+        #Columns are atom id, position and the `(PID, VID)` of the LAE.
+        ours = np.empty((len(gb), 6))
+        ours[:,0] = np.arange(1, len(gb) + 1)
+        ours[:,1:4] = gb.xyz
+        ours[:,4:] = np.array(gb.LAE_keys, dtype=int)[gb.LAE_ids]
         assert np.allclose(ours, model)
 
 def _preload_U(GBCol, eps):
     """Preloads the set of unique vectors and the assignment of specific atoms
     to LAEs in the GB objects.
     """
-    from cPickle import load
+    from gblearn.utility import load_pickle
     upkl = path.join(reporoot, "tests", "unique", "U.pkl")
     with open(upkl, 'rb') as f:
-        U = load(f)
+        U = load_pickle(f)
     GBCol.store.U = {eps: U}
     assert isinstance(GBCol.U(eps), dict)
     
-def test_LER(GBCol):
+def test_loadmodel(loadmodel, tmpdir):
+    """Tests the caching of text model files as `.npy` files.
+    """
+    model = np.random.random((5, 3))
+    txtfile = str(tmpdir.join("model.txt"))
+    np.savetxt(txtfile, model)
+
+    first = loadmodel(txtfile)
+    assert path.isfile(txtfile + ".npy")
+    cached = loadmodel(txtfile)
+    assert isinstance(cached, np.memmap)
+    assert np.array_equal(first, np.loadtxt(txtfile))
+    assert np.array_equal(cached, first)
+
+def test_UniqueSet():
+    """Tests growing the contiguous unique vector storage.
+    """
+    from gblearn.gb import UniqueSet
+    vecs = np.random.random((9, 5))
+    U = UniqueSet(vecs[0], ('0', 0), capacity=2)
+    for i in range(1, len(vecs)):
+        U.append(vecs[i], ('1', i))
+
+    assert len(U) == len(vecs)
+    assert U.keys == [('0', 0)] + [('1', i) for i in range(1, len(vecs))]
+    assert np.allclose(U.U, vecs)
+    assert np.allclose(U.Usq, np.sum(vecs**2, axis=1))
+
+def test_distinct_rows():
+    """Tests finding the first occurrences of duplicated SOAP vectors.
+    """
+    from gblearn.gb import _distinct_rows
+    A = np.array([[2., 1.], [0., 1.], [2., 1.], [1., 1.], [0., 1.]])
+    first, inverse = _distinct_rows(A)
+    assert np.array_equal(first, [0, 1, 3])
+    assert np.array_equal(A[first][inverse], A)
+
+def test_scan_unique_c():
+    """Tests the compiled candidate scan against the pure python one.
+    """
+    _classify = pytest.importorskip("gblearn._classify")
+    from gblearn.gb import _scan_unique_kernel
+    base = np.random.random((10, 8))
+    NP = base[np.random.randint(0, 10, size=50)]
+    NP += np.random.random(NP.shape)*1e-4
+    Psq = np.einsum('ij,ij->i', NP, NP)
+    Pn = np.sqrt(Psq)
+    cand = np.arange(0, 50, 2, dtype=np.intp)
+    model = _scan_unique_kernel(NP, Psq, Pn, cand, 0.01)
+    assert np.array_equal(_classify.scan_unique(NP, Psq, Pn, cand, 0.01), model)
+
+def test_LER(GBCol, soapmodels):
     """Tests construction of the LER.
     """
     #Speed up the test by pre-loading the SOAP matrices. Their construction is
     #tested separately.
-    N = _preload_soap(GBCol)
+    N = _preload_soap(GBCol, soapmodels)
     eps = 0.002500
     #We also want to pre-load the unique vectors.
     _preload_U(GBCol, eps)
@@ -188,5 +355,7 @@ def test_LER(GBCol):
     U = GBCol.U(eps)
     assert LER.shape == (len(GBCol), len(U["U"]))
     
-    model = np.load(path.join(reporoot, "tests", "unique", "LER.pkl"))
+    from gblearn.utility import load_pickle
+    with open(path.join(reporoot, "tests", "unique", "LER.pkl"), 'rb') as f:
+        model = load_pickle(f)
     assert np.allclose(LER, model)
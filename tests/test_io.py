@@ -88,6 +88,11 @@ def test_LER(store):
     eps = [1.1, 2.2, 3.3]
     LER = {e: np.random.random((7, 5)) for e in eps}
     store.LER = LER
+
+    #The pickles must stay readable from python 2.7, so protocol 2 at most.
+    target = path.join(store.LER_, store.SOAP_str, "1.10000.pkl")
+    with open(target, 'rb') as f:
+        assert f.read(2) == b"\x80\x02"
     
     #Ask for a new store so that we can load the arrays from disk and
     #check their equality.